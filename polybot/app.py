@@ -2,7 +2,7 @@ import flask
 from flask import request, jsonify
 import os
 import boto3
-from bot import ObjectDetectionBot
+from bot import ObjectDetectionBot, INTERACTIVE_LANE, BULK_LANE
 import json
 import requests
 from dotenv import load_dotenv
@@ -23,6 +23,9 @@ S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
 DYNAMODB_TABLE = os.getenv('DYNAMODB_TABLE')
 AWS_REGION = os.getenv('AWS_REGION')
 SQS_URL = os.getenv('SQS_URL')
+SQS_BULK_URL = os.getenv('SQS_BULK_URL')
+CHAT_QUOTA = int(os.getenv('CHAT_QUOTA', 5))
+CHAT_QUOTA_WINDOW = int(os.getenv('CHAT_QUOTA_WINDOW', 60))
 
 # Initialize boto3 session globally
 boto_session = boto3.session.Session(region_name=AWS_REGION)
@@ -71,7 +74,8 @@ table = dynamodb.Table(DYNAMODB_TABLE)
 # Define bot object globally
 YOLO5_URL = get_yolo5_url()
 logging.info(f"YOLO5 service URL: {YOLO5_URL}")
-bot = ObjectDetectionBot(TELEGRAM_TOKEN, TELEGRAM_APP_URL, S3_BUCKET_NAME, YOLO5_URL, AWS_REGION, SQS_URL, DYNAMODB_TABLE)
+bot = ObjectDetectionBot(TELEGRAM_TOKEN, TELEGRAM_APP_URL, S3_BUCKET_NAME, YOLO5_URL, AWS_REGION, SQS_URL, DYNAMODB_TABLE,
+                         sqs_bulk_url=SQS_BULK_URL, chat_quota=CHAT_QUOTA, chat_quota_window=CHAT_QUOTA_WINDOW)
 
 def set_webhook():
     try:
@@ -143,12 +147,22 @@ def predict():
         if not image_url:
             return jsonify({'error': 'image_url is required'}), 400
 
+        chat_id = req.get('chat_id')
+        if not chat_id:
+            return jsonify({'error': 'chat_id is required'}), 400
+
+        lane = req.get('lane', INTERACTIVE_LANE)
+        if lane not in (INTERACTIVE_LANE, BULK_LANE):
+            return jsonify({'error': f'lane must be {INTERACTIVE_LANE} or {BULK_LANE}'}), 400
+        lane = bot.assign_lane(chat_id, lane)
+
         message_body = json.dumps({
             'image_url': image_url,
-            'chat_id': req.get('chat_id')
+            'chat_id': chat_id,
+            'lane': lane
         })
         response = boto_session.client('sqs').send_message(
-            QueueUrl=SQS_URL,
+            QueueUrl=bot.lane_queues[lane],
             MessageBody=message_body
         )
 
@@ -163,7 +177,8 @@ def load_test():
     req = request.get_json()
     if req is None:
         return jsonify({'error': 'Empty request payload'}), 400
-    bot.handle_message(req.get('message', {}))
+    # Load-test traffic always goes to the bulk lane so it can't delay real chats
+    bot.handle_message(req.get('message', {}), BULK_LANE)
     return 'Ok'
 
 if __name__ == '__main__':
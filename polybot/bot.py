@@ -7,6 +7,7 @@ import uuid
 import boto3
 from telebot.types import InputFile
 from botocore.exceptions import ClientError
+from chat_quota import ChatQuota, INTERACTIVE_LANE, BULK_LANE
 
 class Bot:
     def __init__(self, token, telegram_chat_url, s3_bucket_name, yolo5_url, aws_region, sqs_url, dynamodb_table):
@@ -130,9 +131,21 @@ class Bot:
 
 
 class ObjectDetectionBot(Bot):
-    def __init__(self, token, telegram_chat_url, s3_bucket_name, yolo5_url, aws_region, sqs_url, dynamodb_table):
+    def __init__(self, token, telegram_chat_url, s3_bucket_name, yolo5_url, aws_region, sqs_url, dynamodb_table,
+                 sqs_bulk_url=None, chat_quota=5, chat_quota_window=60):
         super().__init__(token, telegram_chat_url, s3_bucket_name, yolo5_url, aws_region, sqs_url, dynamodb_table)
 
+        # Bulk/load-test jobs go to their own queue when one is configured
+        self.lane_queues = {INTERACTIVE_LANE: sqs_url, BULK_LANE: sqs_bulk_url or sqs_url}
+        # Interactive jobs allowed per chat within the quota window, extra jobs are demoted to bulk.
+        # The counters live in DynamoDB so all gunicorn workers and instances share them.
+        dynamodb = boto3.resource('dynamodb', region_name=self.aws_region)
+        self.chat_quota = ChatQuota(dynamodb.Table(self.dynamodb_table), chat_quota, chat_quota_window)
+        logger.info(f"SQS Bulk URL: {self.lane_queues[BULK_LANE]}")
+        if sqs_bulk_url and sqs_bulk_url != sqs_url:
+            logger.info("Bulk jobs use a dedicated queue, make sure the yolo5 worker sets the same SQS_BULK_URL")
+        logger.info(f"Chat quota: {chat_quota} interactive jobs per {chat_quota_window}s")
+
         logger.info("Starting to initialize S3 client...")
         self.s3_client = boto3.client('s3', region_name=self.aws_region)
         logger.info("S3 client initialized.")
@@ -167,11 +180,15 @@ class ObjectDetectionBot(Bot):
                 else:
                     raise
 
-    def send_message_to_sqs(self, message_body):
+    def assign_lane(self, chat_id, lane=INTERACTIVE_LANE):
+        """Returns the lane for a new job, demoting chats over their interactive quota to bulk."""
+        return self.chat_quota.assign_lane(chat_id, lane)
+
+    def send_message_to_sqs(self, message_body, lane=INTERACTIVE_LANE):
         for attempt in range(5):
             try:
                 self.sqs_client.send_message(
-                    QueueUrl=self.sqs_url,
+                    QueueUrl=self.lane_queues.get(lane, self.sqs_url),
                     MessageBody=message_body
                 )
                 return
@@ -185,7 +202,7 @@ class ObjectDetectionBot(Bot):
                 else:
                     raise
 
-    def handle_message(self, msg):
+    def handle_message(self, msg, lane=INTERACTIVE_LANE):
         if 'chat' not in msg or 'id' not in msg['chat']:
             return
 
@@ -195,7 +212,7 @@ class ObjectDetectionBot(Bot):
         if 'text' in msg:
             self.handle_text_message(chat_id, msg['text'])
         elif self.is_current_msg_photo(msg):
-            self.handle_photo_message(chat_id, msg)
+            self.handle_photo_message(chat_id, msg, lane)
         else:
             self.send_text(chat_id, 'Unsupported command or message.')
 
@@ -209,7 +226,7 @@ class ObjectDetectionBot(Bot):
         else:
             self.send_text(chat_id, 'Unsupported command. Use /predict.')
 
-    def handle_photo_message(self, chat_id, msg):
+    def handle_photo_message(self, chat_id, msg, lane=INTERACTIVE_LANE):
         if not self.get_pending_status(chat_id):
             self.send_text(chat_id, "Unexpected photo. Please use the /predict command first.")
             return
@@ -223,12 +240,14 @@ class ObjectDetectionBot(Bot):
                 return
 
             s3_object_name = self.upload_to_s3(file_path)
+            job_lane = self.assign_lane(chat_id, lane)
             message_body = json.dumps({
                 'chat_id': chat_id,
                 'photo_id': photo_id,
-                'image_url': s3_object_name
+                'image_url': s3_object_name,
+                'lane': job_lane
             })
-            self.send_message_to_sqs(message_body)
+            self.send_message_to_sqs(message_body, job_lane)
 
         # After processing, set pending status to False
         self.set_pending_status(chat_id, False)
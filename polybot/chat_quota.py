@@ -0,0 +1,55 @@
+import time
+from loguru import logger
+from botocore.exceptions import ClientError
+
+INTERACTIVE_LANE = 'interactive'
+BULK_LANE = 'bulk'
+
+
+class ChatQuota:
+    """Counts interactive jobs per chat in fixed time windows, shared through DynamoDB.
+
+    Every gunicorn worker and polybot instance updates the same counter item, so the
+    quota holds across processes. Counter items carry an `expires_at` attribute;
+    enable DynamoDB TTL on it so idle chats are cleaned up automatically.
+    """
+
+    def __init__(self, table, quota, window, key_name='prediction_id'):
+        self.table = table
+        self.quota = quota
+        self.window = window
+        self.key_name = key_name
+
+    def counter_key(self, chat_id, window_start):
+        return f'chat-quota#{chat_id}#{window_start}'
+
+    def assign_lane(self, chat_id, lane=INTERACTIVE_LANE, now=None):
+        """Returns the lane for a new job, demoting chats over their interactive quota to bulk."""
+        if lane != INTERACTIVE_LANE or chat_id is None:
+            return lane
+
+        now = time.time() if now is None else now
+        window_start = int(now // self.window) * self.window
+        try:
+            # Only count the job if the chat is still under its quota for this window
+            self.table.update_item(
+                Key={self.key_name: self.counter_key(chat_id, window_start)},
+                UpdateExpression='ADD submissions :one SET expires_at = :expires_at',
+                ConditionExpression='attribute_not_exists(submissions) OR submissions < :quota',
+                ExpressionAttributeValues={
+                    ':one': 1,
+                    ':quota': self.quota,
+                    ':expires_at': window_start + 2 * self.window
+                }
+            )
+            return INTERACTIVE_LANE
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                logger.info(f"Chat {chat_id} exceeded its interactive quota, queuing job as {BULK_LANE}")
+                return BULK_LANE
+            logger.error(f"Error updating chat quota: {e.response['Error']['Message']}")
+        except Exception as e:
+            logger.error(f"Error updating chat quota: {e}")
+
+        # Don't hold up a user's job because the quota store is unavailable
+        return INTERACTIVE_LANE
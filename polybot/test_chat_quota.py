@@ -0,0 +1,77 @@
+from botocore.exceptions import ClientError
+from chat_quota import ChatQuota, INTERACTIVE_LANE, BULK_LANE
+
+
+class StubTable:
+    """Keeps items in memory and applies the quota counter's conditional update."""
+
+    def __init__(self, error=None):
+        self.items = {}
+        self.error = error
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression, ExpressionAttributeValues):
+        if self.error:
+            raise self.error
+        key = Key['prediction_id']
+        item = self.items.setdefault(key, {})
+        values = ExpressionAttributeValues
+        if item.get('submissions', 0) >= values[':quota']:
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'failed'}},
+                              'UpdateItem')
+        item['submissions'] = item.get('submissions', 0) + values[':one']
+        item['expires_at'] = values[':expires_at']
+
+    def expire(self, now):
+        """Drops items whose TTL has passed, as DynamoDB TTL would."""
+        self.items = {key: item for key, item in self.items.items() if item['expires_at'] > now}
+
+
+def test_assign_lane_demotes_to_bulk_at_the_quota():
+    quota = ChatQuota(StubTable(), quota=2, window=60)
+
+    lanes = [quota.assign_lane(1, now=100) for _ in range(3)]
+
+    assert lanes == [INTERACTIVE_LANE, INTERACTIVE_LANE, BULK_LANE]
+
+
+def test_quota_is_per_chat():
+    quota = ChatQuota(StubTable(), quota=1, window=60)
+
+    assert quota.assign_lane(1, now=100) == INTERACTIVE_LANE
+    assert quota.assign_lane(2, now=100) == INTERACTIVE_LANE
+    assert quota.assign_lane(1, now=100) == BULK_LANE
+
+
+def test_quota_resets_after_the_window():
+    quota = ChatQuota(StubTable(), quota=1, window=60)
+
+    assert quota.assign_lane(1, now=100) == INTERACTIVE_LANE
+    assert quota.assign_lane(1, now=119) == BULK_LANE
+    assert quota.assign_lane(1, now=120) == INTERACTIVE_LANE
+
+
+def test_idle_chat_counters_expire():
+    table = StubTable()
+    quota = ChatQuota(table, quota=1, window=60)
+    quota.assign_lane(1, now=100)
+
+    assert table.items[quota.counter_key(1, 60)]['expires_at'] == 180
+    table.expire(now=180)
+    assert table.items == {}
+
+
+def test_bulk_and_missing_chat_skip_the_quota():
+    table = StubTable()
+    quota = ChatQuota(table, quota=0, window=60)
+
+    assert quota.assign_lane(None, now=100) == INTERACTIVE_LANE
+    assert quota.assign_lane(1, BULK_LANE, now=100) == BULK_LANE
+    assert table.items == {}
+
+
+def test_quota_store_errors_keep_jobs_interactive():
+    error = ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': 'slow down'}},
+                        'UpdateItem')
+    quota = ChatQuota(StubTable(error=error), quota=1, window=60)
+
+    assert quota.assign_lane(1, now=100) == INTERACTIVE_LANE
@@ -11,6 +11,8 @@ from dotenv import load_dotenv
 import sys
 from urllib.parse import urlparse
 from decimal import Decimal
+from scheduler import FairScheduler, INTERACTIVE_LANE, BULK_LANE, wait_time_seconds
+from intake import SqsIntake
 
 sys.path.append('/usr/src/app/yolov5')
 from detect import run
@@ -23,6 +25,22 @@ SQS_URL = os.getenv('SQS_URL')
 AWS_REGION = os.getenv('AWS_REGION')
 DYNAMODB_TABLE = os.getenv('DYNAMODB_TABLE')
 S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
+SQS_BULK_URL = os.getenv('SQS_BULK_URL')
+
+# Fair-share scheduling settings
+INTERACTIVE_WEIGHT = int(os.getenv('INTERACTIVE_WEIGHT', 3))
+BULK_WEIGHT = int(os.getenv('BULK_WEIGHT', 1))
+CHAT_BUFFER_QUOTA = int(os.getenv('CHAT_BUFFER_QUOTA', 3))
+MAX_BUFFERED_JOBS = int(os.getenv('MAX_BUFFERED_JOBS', 10))
+JOB_VISIBILITY_TIMEOUT = int(os.getenv('JOB_VISIBILITY_TIMEOUT', 300))
+# Held messages get their visibility renewed this often; a single job must finish
+# within JOB_VISIBILITY_TIMEOUT - VISIBILITY_HEARTBEAT seconds
+VISIBILITY_HEARTBEAT = int(os.getenv('VISIBILITY_HEARTBEAT', JOB_VISIBILITY_TIMEOUT // 3))
+MAX_OVERFLOW_JOBS = int(os.getenv('MAX_OVERFLOW_JOBS', 20))
+POLL_WAIT_SECONDS = int(os.getenv('POLL_WAIT_SECONDS', 20))
+WAIT_REPORT_INTERVAL = int(os.getenv('WAIT_REPORT_INTERVAL', 60))
+LANE_WEIGHTS = {INTERACTIVE_LANE: INTERACTIVE_WEIGHT, BULK_LANE: BULK_WEIGHT}
+
 boto_session = boto3.session.Session(region_name=AWS_REGION)
 
 def get_secret(secret_id):
@@ -59,6 +77,16 @@ response = sqs_client.get_queue_url(QueueName=queue_name)
 SQS_QUEUE_NAME = response['QueueUrl']
 logger.info(f"SQS_QUEUE_URL: {SQS_QUEUE_NAME}")
 
+# Bulk/load-test jobs may come from a dedicated queue; otherwise both lanes share one queue.
+# SQS_BULK_URL must be set to the same value here and in polybot.
+LANE_QUEUES = {INTERACTIVE_LANE: SQS_QUEUE_NAME}
+if SQS_BULK_URL and SQS_BULK_URL != SQS_QUEUE_NAME:
+    LANE_QUEUES[BULK_LANE] = SQS_BULK_URL
+    logger.info(f"SQS_BULK_URL: {SQS_BULK_URL}")
+else:
+    logger.warning("SQS_BULK_URL is not set, reading bulk jobs from the main queue only. "
+                   "If polybot sets SQS_BULK_URL, set it here too or bulk jobs will never be processed.")
+
 s3_client = boto3.client('s3', region_name=AWS_REGION)
 dynamodb_client = boto3.resource('dynamodb', region_name=AWS_REGION)
 table = dynamodb_client.Table(DYNAMODB_TABLE)
@@ -161,97 +189,114 @@ def notify_telegram(chat_id, message):
         logger.error(f"Error sending message to Telegram: {e}")
         raise
 
+def process_job(queue_url, sqs_message, message):
+    """Runs YOLOv5 on a single job and reports the result to the chat."""
+    receipt_handle = sqs_message['ReceiptHandle']
+    prediction_id = sqs_message['MessageId']
+    image_url = message.get('image_url')
+    chat_id = message.get('chat_id')
+
+    img_name = get_img_name_from_url(image_url)
+    logger.info(f'Prediction {prediction_id} started for image {img_name}')
+
+    try:
+        original_img_path = download_image_from_s3(img_name)
+        logger.info(f'Image {img_name} downloaded from S3 to {original_img_path}')
+
+        run(
+            weights='yolov5s.pt',
+            data='/usr/src/app/yolov5/data/coco128.yaml',
+            source=original_img_path,
+            project='static/data',
+            name=prediction_id,
+            save_txt=True,
+            exist_ok=True
+        )
+        logger.info(f'YOLOv5 completed processing for {original_img_path}')
+    except Exception as e:
+        logger.error(f'Error during YOLOv5 inference: {e}')
+        return
+
+    logger.info(f'Prediction {prediction_id} completed')
+
+    predicted_img_path = Path(f'static/data/{prediction_id}/{img_name}')
+    pred_summary_path = Path(f'static/data/{prediction_id}/labels/{img_name.split(".")[0]}.txt')
+
+    try:
+        upload_image_to_s3(predicted_img_path, f"predictions/{prediction_id}/{img_name}")
+
+        if pred_summary_path.exists():
+            with open(pred_summary_path) as f:
+                labels = f.read().splitlines()
+                labels = [line.split(' ') for line in labels]
+                labels = [{
+                    'class': names[int(l[0])],
+                    'cx': Decimal(l[1]),
+                    'cy': Decimal(l[2]),
+                    'width': Decimal(l[3]),
+                    'height': Decimal(l[4]),
+                } for l in labels]
+
+            logger.info(f'Prediction summary for {prediction_id}: {labels}')
+
+            prediction_summary = {
+                'prediction_id': prediction_id,
+                'original_img_path': original_img_path,
+                'predicted_img_path': str(predicted_img_path),
+                'chat_id': chat_id,
+                'object_counts': format_prediction_summary(labels)
+            }
+
+            store_prediction_in_dynamodb(prediction_summary)
+            notify_telegram(chat_id, prediction_summary['object_counts'])
+        else:
+            logger.error(f"Prediction summary file not found for {img_name}.")
+
+    except Exception as e:
+        logger.error(f"Error processing prediction for {prediction_id}: {e}")
+
+    finally:
+        # Delete the message from the queue
+        logger.info("Deleting message from SQS...")
+        sqs_client.delete_message(QueueUrl=queue_url, ReceiptHandle=receipt_handle)
+        logger.info("Message deleted from SQS.")
+
 def consume():
+    scheduler = FairScheduler(LANE_WEIGHTS, CHAT_BUFFER_QUOTA)
+    intake = SqsIntake(sqs_client, scheduler, LANE_QUEUES, MAX_BUFFERED_JOBS, MAX_OVERFLOW_JOBS,
+                       JOB_VISIBILITY_TIMEOUT, POLL_WAIT_SECONDS)
+    last_report = time.time()
+    last_heartbeat = time.time()
+
     while True:
         try:
             logger.info("Attempting to receive messages from SQS...")
 
-            responses = sqs_client.receive_message(QueueUrl=SQS_QUEUE_NAME, MaxNumberOfMessages=1, WaitTimeSeconds=20)
-
-            if 'Messages' in responses:
-                message = json.loads(responses['Messages'][0]['Body'])
-                receipt_handle = responses['Messages'][0]['ReceiptHandle']
-
-                # Log the message to inspect its contents
-                logger.info(f"Received SQS message: {message}")
-
-                # Extract values safely
-                prediction_id = responses['Messages'][0]['MessageId']
-                image_url = message.get('image_url')
-                chat_id = message.get('chat_id')
-
-                if not image_url or not chat_id:
-                    logger.error(f"Missing 'image_url' or 'chat_id' in message: {message}")
-                    continue
-
-                img_name = get_img_name_from_url(image_url)
-                logger.info(f'Prediction {prediction_id} started for image {img_name}')
-
-                try:
-                    original_img_path = download_image_from_s3(img_name)
-                    logger.info(f'Image {img_name} downloaded from S3 to {original_img_path}')
-
-                    run(
-                        weights='yolov5s.pt',
-                        data='/usr/src/app/yolov5/data/coco128.yaml',
-                        source=original_img_path,
-                        project='static/data',
-                        name=prediction_id,
-                        save_txt=True,
-                        exist_ok=True
-                    )
-                    logger.info(f'YOLOv5 completed processing for {original_img_path}')
-                except Exception as e:
-                    logger.error(f'Error during YOLOv5 inference: {e}')
-                    continue
-
-                logger.info(f'Prediction {prediction_id} completed')
-
-                predicted_img_path = Path(f'static/data/{prediction_id}/{img_name}')
-                pred_summary_path = Path(f'static/data/{prediction_id}/labels/{img_name.split(".")[0]}.txt')
-
-                try:
-                    upload_image_to_s3(predicted_img_path, f"predictions/{prediction_id}/{img_name}")
-
-                    if pred_summary_path.exists():
-                        with open(pred_summary_path) as f:
-                            labels = f.read().splitlines()
-                            labels = [line.split(' ') for line in labels]
-                            labels = [{
-                                'class': names[int(l[0])],
-                                'cx': Decimal(l[1]),
-                                'cy': Decimal(l[2]),
-                                'width': Decimal(l[3]),
-                                'height': Decimal(l[4]),
-                            } for l in labels]
-
-                        logger.info(f'Prediction summary for {prediction_id}: {labels}')
-
-                        prediction_summary = {
-                            'prediction_id': prediction_id,
-                            'original_img_path': original_img_path,
-                            'predicted_img_path': str(predicted_img_path),
-                            'chat_id': chat_id,
-                            'object_counts': format_prediction_summary(labels)
-                        }
-
-                        store_prediction_in_dynamodb(prediction_summary)
-                        notify_telegram(chat_id, prediction_summary['object_counts'])
-                    else:
-                        logger.error(f"Prediction summary file not found for {img_name}.")
-
-                except Exception as e:
-                    logger.error(f"Error processing prediction for {prediction_id}: {e}")
-                    continue
-
-                finally:
-                    # Delete the message from the queue
-                    logger.info("Deleting message from SQS...")
-                    sqs_client.delete_message(QueueUrl=SQS_QUEUE_NAME, ReceiptHandle=receipt_handle)
-                    logger.info("Message deleted from SQS.")
-            else:
+            received_any = intake.receive_jobs()
+            next_job = scheduler.next_job()
+
+            if next_job:
+                lane, chat_id, job = next_job
+                queue_url, sqs_message, message = job
+
+                # Keep the running job and everything still waiting hidden from other polls
+                if time.time() - last_heartbeat >= VISIBILITY_HEARTBEAT:
+                    intake.extend_visibility([job, *scheduler.held_jobs()])
+                    last_heartbeat = time.time()
+                wait_seconds = wait_time_seconds(sqs_message)
+                if wait_seconds is not None:
+                    scheduler.record_wait(chat_id, wait_seconds)
+                    logger.info(f"Job {sqs_message['MessageId']} for chat {chat_id} ({lane}) "
+                                f"waited {wait_seconds:.2f}s")
+
+                process_job(queue_url, sqs_message, message)
+            elif not received_any:
                 logger.info("No messages received. Retrying...")
 
+            if time.time() - last_report >= WAIT_REPORT_INTERVAL:
+                logger.info(f"Per-chat wait times over the last {WAIT_REPORT_INTERVAL}s: {scheduler.wait_report()}")
+                last_report = time.time()
+
         except Exception as e:
             logger.error(f"Error while consuming messages: {e}")
             time.sleep(1)  # Wait a moment before retrying
@@ -0,0 +1,135 @@
+import json
+from loguru import logger
+from scheduler import INTERACTIVE_LANE, BULK_LANE
+
+
+class SqsIntake:
+    """Moves messages between the SQS lane queues and a FairScheduler.
+
+    Kept apart from app.py so it can be used with any SQS client, without the
+    module-level AWS setup the worker does on import.
+    """
+
+    def __init__(self, sqs_client, scheduler, lane_queues, max_buffered_jobs, max_overflow_jobs,
+                 visibility_timeout, poll_wait_seconds):
+        self.sqs_client = sqs_client
+        self.scheduler = scheduler
+        self.lane_queues = lane_queues
+        self.max_buffered_jobs = max_buffered_jobs
+        self.max_overflow_jobs = max_overflow_jobs
+        self.visibility_timeout = visibility_timeout
+        self.poll_wait_seconds = poll_wait_seconds
+
+    def has_dedicated_lanes(self):
+        return BULK_LANE in self.lane_queues
+
+    def fed_lanes(self, queue_lane):
+        """Returns the scheduler lanes that messages from a lane's queue can end up in."""
+        if self.has_dedicated_lanes():
+            return [queue_lane]
+        return list(self.scheduler.lanes)
+
+    def job_lane(self, queue_lane, message):
+        """Picks the lane of a received job."""
+        # With a dedicated bulk queue, each queue decides its lane; a shared queue trusts the message
+        if self.has_dedicated_lanes():
+            return queue_lane
+        return message.get('lane', INTERACTIVE_LANE)
+
+    def poll_queue(self, lane, queue_url, wait_seconds):
+        """Receives messages from one lane queue into the scheduler buffer."""
+        # Never receive more than the buffer, or the overflow of any lane this queue feeds, can hold
+        capacity = self.max_buffered_jobs - len(self.scheduler)
+        overflow_room = self.max_overflow_jobs - max(self.scheduler.overflow_counts[fed_lane]
+                                                     for fed_lane in self.fed_lanes(lane))
+        capacity = min(capacity, overflow_room)
+        if capacity <= 0:
+            return False
+
+        # A failing queue (bad URL, missing permission) must not stop the other lanes
+        try:
+            responses = self.sqs_client.receive_message(
+                QueueUrl=queue_url,
+                MaxNumberOfMessages=min(capacity, 10),
+                WaitTimeSeconds=wait_seconds,
+                VisibilityTimeout=self.visibility_timeout,
+                AttributeNames=['SentTimestamp']
+            )
+        except Exception as e:
+            logger.error(f"Error receiving messages from the {lane} queue {queue_url}: {e}")
+            return False
+
+        received_any = False
+        for sqs_message in responses.get('Messages', []):
+            received_any = True
+            try:
+                message = json.loads(sqs_message['Body'])
+            except ValueError as e:
+                logger.error(f"Malformed body in message {sqs_message['MessageId']}: {e}")
+                self.discard_message(queue_url, sqs_message)
+                continue
+
+            # Log the message to inspect its contents
+            logger.info(f"Received SQS message: {message}")
+
+            if not isinstance(message, dict) or not message.get('image_url') or not message.get('chat_id'):
+                logger.error(f"Missing 'image_url' or 'chat_id' in message: {message}")
+                self.discard_message(queue_url, sqs_message)
+                continue
+
+            chat_id = message['chat_id']
+
+            job_lane = self.job_lane(lane, message)
+            if not self.scheduler.add(job_lane, chat_id, (queue_url, sqs_message, message)):
+                logger.info(f"Chat {chat_id} is over its quota of {self.scheduler.per_chat_quota} buffered jobs, "
+                            f"parking message {sqs_message['MessageId']} in overflow")
+
+        return received_any
+
+    def discard_message(self, queue_url, sqs_message):
+        """Deletes a message that can never be processed so it stops coming back."""
+        try:
+            self.sqs_client.delete_message(QueueUrl=queue_url, ReceiptHandle=sqs_message['ReceiptHandle'])
+            logger.info(f"Deleted unprocessable message {sqs_message['MessageId']} from SQS.")
+        except Exception as e:
+            logger.error(f"Error deleting unprocessable message {sqs_message['MessageId']}: {e}")
+
+    def receive_jobs(self):
+        """Pulls messages from the lane queues into the scheduler buffer."""
+        # Short-poll every lane first so a backlog in one queue never hides the other
+        received_any = False
+        for lane, queue_url in self.lane_queues.items():
+            received_any = self.poll_queue(lane, queue_url, 0) or received_any
+
+        # Only long-poll the interactive queue, and only when there is nothing else to do
+        if not len(self.scheduler) and not received_any:
+            received_any = self.poll_queue(INTERACTIVE_LANE, self.lane_queues[INTERACTIVE_LANE],
+                                           self.poll_wait_seconds)
+
+        return received_any
+
+    def extend_visibility(self, jobs):
+        """Renews the visibility timeout of held messages so they aren't received twice."""
+        messages_by_queue = {}
+        for queue_url, sqs_message, _ in jobs:
+            messages_by_queue.setdefault(queue_url, []).append(sqs_message)
+
+        for queue_url, sqs_messages in messages_by_queue.items():
+            # SQS accepts at most 10 entries per batch
+            for start in range(0, len(sqs_messages), 10):
+                batch = sqs_messages[start:start + 10]
+                try:
+                    response = self.sqs_client.change_message_visibility_batch(
+                        QueueUrl=queue_url,
+                        Entries=[{
+                            'Id': str(index),
+                            'ReceiptHandle': sqs_message['ReceiptHandle'],
+                            'VisibilityTimeout': self.visibility_timeout
+                        } for index, sqs_message in enumerate(batch)]
+                    )
+                    for failed in response.get('Failed', []):
+                        sqs_message = batch[int(failed['Id'])]
+                        logger.error(f"Error extending visibility of message {sqs_message['MessageId']}: "
+                                     f"{failed.get('Message')}")
+                except Exception as e:
+                    logger.error(f"Error extending visibility of messages in {queue_url}: {e}")
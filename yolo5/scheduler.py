@@ -0,0 +1,123 @@
+import time
+from collections import OrderedDict, deque
+
+INTERACTIVE_LANE = 'interactive'
+BULK_LANE = 'bulk'
+
+
+class FairScheduler:
+    """Buffers received SQS jobs and hands them out fairly.
+
+    Jobs are grouped into priority lanes (e.g. interactive vs. bulk/load-test).
+    Lanes are drained by weight, and inside a lane chats are served round-robin,
+    so a single chat flooding the queue cannot starve the other chats.
+
+    Each chat may have at most `per_chat_quota` jobs in the lanes. Extra jobs are
+    parked in a per-chat overflow and promoted as the chat's earlier jobs finish.
+    Parked jobs are counted per lane in `overflow_counts`.
+    """
+
+    def __init__(self, lane_weights, per_chat_quota, wait_window=100):
+        self.lane_weights = dict(lane_weights)
+        self.per_chat_quota = per_chat_quota
+        self.lanes = {lane: OrderedDict() for lane in self.lane_weights}
+        self.credits = dict(self.lane_weights)
+        self.chat_counts = {}
+        self.overflow = {}
+        self.overflow_counts = {lane: 0 for lane in self.lane_weights}
+        self.wait_window = wait_window
+        self.wait_stats = {}
+
+    def __len__(self):
+        return sum(self.chat_counts.values())
+
+    @property
+    def overflow_count(self):
+        return sum(self.overflow_counts.values())
+
+    def add(self, lane, chat_id, job):
+        """Buffers a job. Returns False if the chat is over its quota and the job was parked in overflow."""
+        if lane not in self.lanes:
+            lane = BULK_LANE if BULK_LANE in self.lanes else next(iter(self.lanes))
+        if self.chat_counts.get(chat_id, 0) >= self.per_chat_quota:
+            self.overflow.setdefault(chat_id, deque()).append((lane, job))
+            self.overflow_counts[lane] += 1
+            return False
+
+        self.lanes[lane].setdefault(chat_id, deque()).append(job)
+        self.chat_counts[chat_id] = self.chat_counts.get(chat_id, 0) + 1
+        return True
+
+    def next_job(self):
+        """Returns the next (lane, chat_id, job) to process, or None if empty."""
+        ready = [lane for lane, chats in self.lanes.items() if chats]
+        if not ready:
+            return None
+
+        # Weighted round-robin between lanes: refill credits once every
+        # non-empty lane has used up its share.
+        if all(self.credits[lane] <= 0 for lane in ready):
+            self.credits = dict(self.lane_weights)
+        lane = max(ready, key=lambda l: self.credits[l])
+        self.credits[lane] -= 1
+
+        # Round-robin between chats inside the lane
+        chats = self.lanes[lane]
+        chat_id, jobs = chats.popitem(last=False)
+        job = jobs.popleft()
+        if jobs:
+            chats[chat_id] = jobs
+
+        self.chat_counts[chat_id] -= 1
+        if not self.chat_counts[chat_id]:
+            del self.chat_counts[chat_id]
+
+        # The chat freed a slot, promote its oldest parked job
+        if chat_id in self.overflow:
+            overflow_lane, overflow_job = self.overflow[chat_id].popleft()
+            if not self.overflow[chat_id]:
+                del self.overflow[chat_id]
+            self.overflow_counts[overflow_lane] -= 1
+            self.add(overflow_lane, chat_id, overflow_job)
+
+        return lane, chat_id, job
+
+    def held_jobs(self):
+        """Yields every job still held by the scheduler, buffered or in overflow."""
+        for chats in self.lanes.values():
+            for jobs in chats.values():
+                yield from jobs
+        for parked in self.overflow.values():
+            for _, job in parked:
+                yield job
+
+    def record_wait(self, chat_id, wait_seconds):
+        """Records how long a job waited between enqueue and processing start."""
+        self.wait_stats.setdefault(chat_id, deque(maxlen=self.wait_window)).append(wait_seconds)
+
+    def wait_report(self):
+        """Summarizes per-chat wait times (seconds) since the last report: count, avg, p95 and max.
+
+        The samples are cleared afterwards, so idle chats drop out of the next report.
+        """
+        report = {}
+        for chat_id, waits in self.wait_stats.items():
+            ordered = sorted(waits)
+            p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+            report[chat_id] = {
+                'count': len(ordered),
+                'avg': round(sum(ordered) / len(ordered), 3),
+                'p95': round(ordered[p95_index], 3),
+                'max': round(ordered[-1], 3),
+            }
+        self.wait_stats = {}
+        return report
+
+
+def wait_time_seconds(sqs_message, now=None):
+    """Computes how long an SQS message waited, based on its SentTimestamp attribute."""
+    sent_timestamp = sqs_message.get('Attributes', {}).get('SentTimestamp')
+    if not sent_timestamp:
+        return None
+    now = time.time() if now is None else now
+    return max(0.0, now - int(sent_timestamp) / 1000.0)
@@ -0,0 +1,219 @@
+import json
+from intake import SqsIntake
+from scheduler import FairScheduler, INTERACTIVE_LANE, BULK_LANE
+
+INTERACTIVE_QUEUE = 'https://sqs/interactive'
+BULK_QUEUE = 'https://sqs/bulk'
+
+
+class StubSqsClient:
+    """Records SQS calls and serves queued messages per queue URL."""
+
+    def __init__(self, messages=None, visibility_failures=(), visibility_errors=0, failing_queues=()):
+        self.messages = {url: list(queued) for url, queued in (messages or {}).items()}
+        self.failing_queues = set(failing_queues)
+        self.visibility_failures = set(visibility_failures)
+        self.visibility_errors = visibility_errors
+        self.receive_calls = []
+        self.visibility_calls = []
+        self.deleted = []
+
+    def receive_message(self, **kwargs):
+        self.receive_calls.append(kwargs)
+        if kwargs['QueueUrl'] in self.failing_queues:
+            raise RuntimeError('AccessDenied')
+        queued = self.messages.get(kwargs['QueueUrl'], [])
+        batch, self.messages[kwargs['QueueUrl']] = queued[:kwargs['MaxNumberOfMessages']], \
+            queued[kwargs['MaxNumberOfMessages']:]
+        return {'Messages': batch} if batch else {}
+
+    def delete_message(self, **kwargs):
+        self.deleted.append(kwargs['ReceiptHandle'])
+
+    def change_message_visibility_batch(self, **kwargs):
+        self.visibility_calls.append(kwargs)
+        if self.visibility_errors:
+            self.visibility_errors -= 1
+            raise RuntimeError('AccessDenied')
+        return {'Failed': [{'Id': entry['Id'], 'Message': 'expired'} for entry in kwargs['Entries']
+                           if entry['ReceiptHandle'] in self.visibility_failures]}
+
+
+def sqs_message(index, chat_id='chat', **body):
+    body = {'image_url': f'img{index}.jpg', 'chat_id': chat_id, **body}
+    return {'MessageId': f'm{index}', 'ReceiptHandle': f'r{index}', 'Body': json.dumps(body)}
+
+
+def intake_job(queue_url, index, chat_id='chat'):
+    message = sqs_message(index, chat_id)
+    return queue_url, message, json.loads(message['Body'])
+
+
+def make_intake(client, lane_queues=None, max_buffered_jobs=10, max_overflow_jobs=20, chat_quota=10):
+    scheduler = FairScheduler({INTERACTIVE_LANE: 3, BULK_LANE: 1}, chat_quota)
+    lane_queues = lane_queues or {INTERACTIVE_LANE: INTERACTIVE_QUEUE, BULK_LANE: BULK_QUEUE}
+    return SqsIntake(client, scheduler, lane_queues, max_buffered_jobs, max_overflow_jobs,
+                     visibility_timeout=300, poll_wait_seconds=20)
+
+
+def test_poll_queue_asks_only_for_free_buffer_slots():
+    client = StubSqsClient({INTERACTIVE_QUEUE: [sqs_message(i) for i in range(10)]})
+    intake = make_intake(client, max_buffered_jobs=4)
+    intake.scheduler.add(INTERACTIVE_LANE, 'other', 'job')
+
+    assert intake.poll_queue(INTERACTIVE_LANE, INTERACTIVE_QUEUE, 0)
+
+    assert client.receive_calls[0]['MaxNumberOfMessages'] == 3
+    assert client.receive_calls[0]['VisibilityTimeout'] == 300
+    assert len(intake.scheduler) == 4
+
+
+def test_poll_queue_skips_receive_when_buffer_is_full():
+    client = StubSqsClient({INTERACTIVE_QUEUE: [sqs_message(0)]})
+    intake = make_intake(client, max_buffered_jobs=1)
+    intake.scheduler.add(INTERACTIVE_LANE, 'other', 'job')
+
+    assert not intake.poll_queue(INTERACTIVE_LANE, INTERACTIVE_QUEUE, 0)
+    assert client.receive_calls == []
+
+
+def test_poll_queue_never_receives_past_the_overflow_limit():
+    client = StubSqsClient({INTERACTIVE_QUEUE: [sqs_message(i) for i in range(10)]})
+    intake = make_intake(client, max_overflow_jobs=2, chat_quota=1)
+
+    for _ in range(5):
+        intake.poll_queue(INTERACTIVE_LANE, INTERACTIVE_QUEUE, 0)
+
+    assert [call['MaxNumberOfMessages'] for call in client.receive_calls] == [2, 1]
+    assert intake.scheduler.overflow_counts[INTERACTIVE_LANE] == 2
+
+
+def test_full_bulk_overflow_does_not_block_interactive_intake():
+    client = StubSqsClient({
+        INTERACTIVE_QUEUE: [sqs_message(0, chat_id='user')],
+        BULK_QUEUE: [sqs_message(i, chat_id='load') for i in range(1, 10)],
+    })
+    intake = make_intake(client, max_overflow_jobs=2, chat_quota=1)
+    intake.poll_queue(BULK_LANE, BULK_QUEUE, 0)
+    intake.poll_queue(BULK_LANE, BULK_QUEUE, 0)
+    assert intake.scheduler.overflow_counts[BULK_LANE] == 2
+    client.receive_calls.clear()
+
+    intake.receive_jobs()
+
+    assert [call['QueueUrl'] for call in client.receive_calls] == [INTERACTIVE_QUEUE]
+    assert intake.scheduler.next_job() == (INTERACTIVE_LANE, 'user', intake_job(INTERACTIVE_QUEUE, 0, 'user'))
+
+
+def test_dedicated_interactive_queue_ignores_lane_in_body():
+    client = StubSqsClient({INTERACTIVE_QUEUE: [sqs_message(0, lane=BULK_LANE)]})
+    intake = make_intake(client)
+
+    intake.poll_queue(INTERACTIVE_LANE, INTERACTIVE_QUEUE, 0)
+
+    assert intake.scheduler.next_job()[0] == INTERACTIVE_LANE
+
+
+def test_shared_queue_uses_lane_from_body_and_checks_every_lane_overflow():
+    client = StubSqsClient({INTERACTIVE_QUEUE: [sqs_message(i, chat_id='load', lane=BULK_LANE) for i in range(5)]})
+    intake = make_intake(client, lane_queues={INTERACTIVE_LANE: INTERACTIVE_QUEUE},
+                         max_overflow_jobs=2, chat_quota=1)
+
+    intake.poll_queue(INTERACTIVE_LANE, INTERACTIVE_QUEUE, 0)
+    intake.poll_queue(INTERACTIVE_LANE, INTERACTIVE_QUEUE, 0)
+    intake.poll_queue(INTERACTIVE_LANE, INTERACTIVE_QUEUE, 0)
+
+    assert intake.scheduler.overflow_counts == {INTERACTIVE_LANE: 0, BULK_LANE: 2}
+    assert len(client.receive_calls) == 2
+    assert intake.scheduler.next_job()[0] == BULK_LANE
+
+
+def test_bulk_queue_messages_always_use_the_bulk_lane():
+    client = StubSqsClient({BULK_QUEUE: [sqs_message(0, lane=INTERACTIVE_LANE)]})
+    intake = make_intake(client)
+
+    intake.poll_queue(BULK_LANE, BULK_QUEUE, 0)
+
+    assert intake.scheduler.next_job()[0] == BULK_LANE
+
+
+def test_poll_queue_deletes_unprocessable_messages_and_keeps_the_rest():
+    malformed = {'MessageId': 'bad', 'ReceiptHandle': 'r-bad', 'Body': '{not json'}
+    not_a_dict = {'MessageId': 'list', 'ReceiptHandle': 'r-list', 'Body': '[]'}
+    client = StubSqsClient({INTERACTIVE_QUEUE: [
+        sqs_message(0), malformed, not_a_dict, sqs_message(1, chat_id=None), sqs_message(2),
+    ]})
+    intake = make_intake(client)
+
+    assert intake.poll_queue(INTERACTIVE_LANE, INTERACTIVE_QUEUE, 0)
+
+    assert client.deleted == ['r-bad', 'r-list', 'r1']
+    assert sorted(job[1]['MessageId'] for job in intake.scheduler.held_jobs()) == ['m0', 'm2']
+
+
+def test_receive_jobs_short_polls_every_lane_then_long_polls_interactive():
+    client = StubSqsClient()
+    intake = make_intake(client)
+
+    assert not intake.receive_jobs()
+
+    assert [(call['QueueUrl'], call['WaitTimeSeconds']) for call in client.receive_calls] == [
+        (INTERACTIVE_QUEUE, 0),
+        (BULK_QUEUE, 0),
+        (INTERACTIVE_QUEUE, 20),
+    ]
+
+
+def test_receive_jobs_does_not_long_poll_with_jobs_buffered():
+    client = StubSqsClient({BULK_QUEUE: [sqs_message(0)]})
+    intake = make_intake(client)
+
+    assert intake.receive_jobs()
+
+    assert [call['WaitTimeSeconds'] for call in client.receive_calls] == [0, 0]
+
+
+def test_failing_bulk_queue_does_not_block_interactive_lane():
+    client = StubSqsClient({INTERACTIVE_QUEUE: [sqs_message(0)]}, failing_queues={BULK_QUEUE})
+    intake = make_intake(client)
+
+    assert intake.receive_jobs()
+
+    assert intake.scheduler.next_job()[0] == INTERACTIVE_LANE
+    assert [call['QueueUrl'] for call in client.receive_calls] == [INTERACTIVE_QUEUE, BULK_QUEUE]
+
+
+def test_failing_interactive_queue_still_long_polls_without_raising():
+    client = StubSqsClient(failing_queues={INTERACTIVE_QUEUE})
+    intake = make_intake(client)
+
+    assert not intake.receive_jobs()
+
+    assert [call['WaitTimeSeconds'] for call in client.receive_calls] == [0, 0, 20]
+
+
+def test_extend_visibility_batches_per_queue_in_groups_of_ten():
+    client = StubSqsClient()
+    intake = make_intake(client)
+    jobs = [(INTERACTIVE_QUEUE, sqs_message(i), {}) for i in range(12)] + \
+        [(BULK_QUEUE, sqs_message(i), {}) for i in range(12, 15)]
+
+    intake.extend_visibility(jobs)
+
+    assert [(call['QueueUrl'], len(call['Entries'])) for call in client.visibility_calls] == [
+        (INTERACTIVE_QUEUE, 10),
+        (INTERACTIVE_QUEUE, 2),
+        (BULK_QUEUE, 3),
+    ]
+    assert all(entry['VisibilityTimeout'] == 300
+               for call in client.visibility_calls for entry in call['Entries'])
+
+
+def test_extend_visibility_keeps_going_after_failures():
+    client = StubSqsClient(visibility_failures={'r11'}, visibility_errors=1)
+    intake = make_intake(client)
+    jobs = [(INTERACTIVE_QUEUE, sqs_message(i), {}) for i in range(12)]
+
+    intake.extend_visibility(jobs)
+
+    assert len(client.visibility_calls) == 2
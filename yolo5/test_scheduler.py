@@ -0,0 +1,90 @@
+from scheduler import FairScheduler, INTERACTIVE_LANE, BULK_LANE, wait_time_seconds
+
+
+def drain(scheduler):
+    jobs = []
+    while (next_job := scheduler.next_job()) is not None:
+        jobs.append(next_job)
+    return jobs
+
+
+def test_lanes_are_drained_by_weight():
+    scheduler = FairScheduler({INTERACTIVE_LANE: 3, BULK_LANE: 1}, per_chat_quota=10)
+    for i in range(6):
+        scheduler.add(INTERACTIVE_LANE, 'chat', f'i{i}')
+        scheduler.add(BULK_LANE, 'load', f'b{i}')
+
+    lanes = [lane for lane, _, _ in drain(scheduler)]
+
+    assert lanes[:8] == [INTERACTIVE_LANE] * 3 + [BULK_LANE] + [INTERACTIVE_LANE] * 3 + [BULK_LANE]
+    assert lanes[8:] == [BULK_LANE] * 4
+
+
+def test_chats_are_served_round_robin_within_a_lane():
+    scheduler = FairScheduler({INTERACTIVE_LANE: 1}, per_chat_quota=10)
+    for i in range(3):
+        scheduler.add(INTERACTIVE_LANE, 'spam', f's{i}')
+    scheduler.add(INTERACTIVE_LANE, 'a', 'a0')
+    scheduler.add(INTERACTIVE_LANE, 'b', 'b0')
+
+    jobs = [job for _, _, job in drain(scheduler)]
+
+    assert jobs == ['s0', 'a0', 'b0', 's1', 's2']
+
+
+def test_add_parks_jobs_over_quota_in_overflow():
+    scheduler = FairScheduler({INTERACTIVE_LANE: 1}, per_chat_quota=2)
+
+    accepted = [scheduler.add(INTERACTIVE_LANE, 'spam', i) for i in range(4)]
+
+    assert accepted == [True, True, False, False]
+    assert len(scheduler) == 2
+    assert scheduler.overflow_count == 2
+    assert scheduler.overflow_counts == {INTERACTIVE_LANE: 2}
+    assert sorted(scheduler.held_jobs()) == [0, 1, 2, 3]
+
+
+def test_overflow_is_promoted_as_the_chat_finishes_jobs():
+    scheduler = FairScheduler({INTERACTIVE_LANE: 1}, per_chat_quota=1)
+    for i in range(3):
+        scheduler.add(INTERACTIVE_LANE, 'spam', f's{i}')
+    scheduler.add(INTERACTIVE_LANE, 'other', 'o0')
+
+    jobs = [job for _, _, job in drain(scheduler)]
+
+    assert jobs == ['s0', 'o0', 's1', 's2']
+    assert scheduler.overflow_count == 0
+    assert len(scheduler) == 0
+
+
+def test_unknown_lane_falls_back_to_bulk():
+    scheduler = FairScheduler({INTERACTIVE_LANE: 3, BULK_LANE: 1}, per_chat_quota=10)
+
+    scheduler.add('mystery', 'chat', 'job')
+
+    assert scheduler.next_job() == (BULK_LANE, 'chat', 'job')
+
+
+def test_unknown_lane_falls_back_to_first_lane_without_bulk():
+    scheduler = FairScheduler({INTERACTIVE_LANE: 1}, per_chat_quota=10)
+
+    scheduler.add('mystery', 'chat', 'job')
+
+    assert scheduler.next_job() == (INTERACTIVE_LANE, 'chat', 'job')
+
+
+def test_wait_report_summarizes_and_resets():
+    scheduler = FairScheduler({INTERACTIVE_LANE: 1}, per_chat_quota=10)
+    for wait in range(1, 21):
+        scheduler.record_wait('chat', float(wait))
+
+    report = scheduler.wait_report()
+
+    assert report == {'chat': {'count': 20, 'avg': 10.5, 'p95': 19.0, 'max': 20.0}}
+    assert scheduler.wait_report() == {}
+
+
+def test_wait_time_seconds_uses_sent_timestamp():
+    assert wait_time_seconds({'Attributes': {'SentTimestamp': '1000'}}, now=3.5) == 2.5
+    assert wait_time_seconds({'Attributes': {'SentTimestamp': '5000'}}, now=3.0) == 0.0
+    assert wait_time_seconds({}) is None